@@ -1,10 +1,22 @@
 import os
 import pathlib
 import secrets
+import time
+import shutil
+import sqlite3
+import concurrent.futures
 import mimetypes # Used for serving files
+from functools import wraps
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, session, abort
+from urllib.parse import unquote
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, session, abort, g, Response
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, event, text
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable, AddConstraint
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import selectinload, joinedload, raiseload, lazyload, contains_eager
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_mail import Mail, Message 
@@ -45,7 +57,17 @@ TEMPLATES_DIR = BASE_DIR / 'templates'
 
 SECRET_KEY = os.environ.get('LMS_SECRET_KEY', 'dev-secret-key')
 ALLOWED_EXTENSIONS = {'mp4', 'mkv', 'webm', 'wav', 'mp3', 'ogg', 'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'zip', 'rar', 'txt', 'csv', 'json', 'py', 'ipynb', 'html', 'css', 'js'}
+ALLOWED_EXT_FS = frozenset(ALLOWED_EXTENSIONS)
 MAX_CONTENT_LENGTH = 5 * 1024 * 1024 * 1024  # 5 GB
+ADMIN_METRICS_TTL = 30  # seconds the admin dashboard counts are reused
+PER_PAGE = 50  # rows per page on the admin "view all" lists
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB copy buffer for streamed uploads
+MAX_PROFILE_PIC_SIZE = 10 * 1024 * 1024  # 10 MB; larger profile pictures are skipped, the rest of the form still saves
+
+# Background workers for slow I/O that the request does not need to wait on
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+# Separate worker so profile pictures never queue behind SMTP sends or batch-folder deletes
+PROFILE_PIC_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = SECRET_KEY
@@ -61,6 +83,20 @@ elif not DB_URI:
 app.config['SQLALCHEMY_DATABASE_URI'] = DB_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+# Behind a server with X-Sendfile support, let it stream recordings instead of the Python worker
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'False') == 'True'
+# PostgreSQL has no database file to back up first, so rewriting its foreign keys at startup is opt-in
+MIGRATE_FOREIGN_KEYS = os.getenv('MIGRATE_FOREIGN_KEYS', 'False') == 'True'
+
+if DB_URI.startswith('sqlite'):
+    # Keep a few SQLite connections open so each one's page cache stays warm between requests
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': QueuePool,
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_pre_ping': False,
+        'connect_args': {'check_same_thread': False},
+    }
 
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = os.getenv('MAIL_PORT', 587)
@@ -73,6 +109,20 @@ app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME')
 mail = Mail(app)
 db = SQLAlchemy(app)
 
+# SQLite tuning: WAL lets readers run alongside a writer, the larger page cache/mmap keep hot pages in memory
+if DB_URI.startswith('sqlite'):
+    with app.app_context():
+        @event.listens_for(db.engine, "connect")
+        def _sqlite_pragmas(dbapi_conn, _):
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA foreign_keys=ON")  # required for the ON DELETE rules on the models
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+            cur.execute("PRAGMA temp_store=memory")
+            cur.execute("PRAGMA cache_size=-64000")
+            cur.execute("PRAGMA mmap_size=268435456")
+            cur.close()
+
 # ---------------- Models ----------------
 
 class User(db.Model):
@@ -86,8 +136,13 @@ class User(db.Model):
     phone = db.Column(db.String(20), nullable=True)
     address = db.Column(db.String(200), nullable=True)
     about = db.Column(db.Text, nullable=True)
-    enrollments = db.relationship('Enrollment', backref='user', cascade='all, delete-orphan')
-    progress = db.relationship('StudentProgress', backref='student', lazy=True)
+    enrollments = db.relationship('Enrollment', back_populates='user', cascade='all, delete-orphan')
+    # Progress rows and queries go with the user; the database removes the ones that are not loaded (ON DELETE)
+    progress = db.relationship('StudentProgress', back_populates='student', lazy='select', cascade='all, delete-orphan', passive_deletes=True)
+    queries = db.relationship('Query', back_populates='user', lazy='select', cascade='all, delete-orphan', passive_deletes=True)
+    trainer = db.relationship('Trainer', back_populates='user', uselist=False, passive_deletes=True)
+
+    __table_args__ = (db.Index('ix_user_role_created', 'role', 'created_at'),)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -98,13 +153,15 @@ class User(db.Model):
 class Trainer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, index=True, nullable=False)
     expertise = db.Column(db.String(200), nullable=True)
     profile_pic = db.Column(db.String(200), nullable=True)
     phone = db.Column(db.String(20), nullable=True)
     address = db.Column(db.String(200), nullable=True)
     about = db.Column(db.Text, nullable=True)
-    batches = db.relationship('Batch', backref='trainer', lazy=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), unique=True, index=True, nullable=True)
+    user = db.relationship('User', back_populates='trainer')
+    batches = db.relationship('Batch', back_populates='trainer', lazy='select')
 
 class Batch(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -112,51 +169,218 @@ class Batch(db.Model):
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     trainer_id = db.Column(db.Integer, db.ForeignKey('trainer.id'), nullable=True)
-    recordings = db.relationship('Recording', backref='batch', cascade='all, delete-orphan')
-    enrollments = db.relationship('Enrollment', backref='batch', cascade='all, delete-orphan')
+    trainer = db.relationship('Trainer', back_populates='batches', lazy='joined')
+    # Child rows are removed by the database (ON DELETE), so the ORM does not load them just to delete them
+    recordings = db.relationship('Recording', back_populates='batch', lazy='select', cascade='all, delete-orphan', passive_deletes=True)
+    enrollments = db.relationship('Enrollment', back_populates='batch', cascade='all, delete-orphan', passive_deletes=True)
+    queries = db.relationship('Query', back_populates='batch', lazy='select', passive_deletes=True)
 
 class Enrollment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
-    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id'), index=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), index=True)
     enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user = db.relationship('User', back_populates='enrollments', lazy='select')
+    batch = db.relationship('Batch', back_populates='enrollments', lazy='select')
+
+    __table_args__ = (db.Index('ix_enroll_user_batch', 'user_id', 'batch_id', unique=True),)
 
 class Recording(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(500), nullable=False)
     original_name = db.Column(db.String(500), nullable=False)
     upload_time = db.Column(db.DateTime, default=datetime.utcnow)
-    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id'))
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'))
     notes = db.Column(db.Text, nullable=True)
-    progress = db.relationship('StudentProgress', backref='recording', lazy=True)
+    # 'select' resolves from the identity map when the batch is already loaded; 'joined' would re-join batch/trainer into every recordings load
+    batch = db.relationship('Batch', back_populates='recordings', lazy='select')
+    progress = db.relationship('StudentProgress', back_populates='recording', lazy='select', passive_deletes=True)
 
 class StudentProgress(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
-    recording_id = db.Column(db.Integer, db.ForeignKey('recording.id'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), index=True)
+    recording_id = db.Column(db.Integer, db.ForeignKey('recording.id', ondelete='CASCADE'))
     completed = db.Column(db.Boolean, default=False)
     completed_at = db.Column(db.DateTime, nullable=True)
 
+    # ix_sp_rec_completed also serves plain recording_id lookups, so that column needs no index of its own
+    __table_args__ = (db.Index('ix_sp_user_rec', 'user_id', 'recording_id', unique=True),
+                      db.Index('ix_sp_rec_completed', 'recording_id', 'completed'))
+    student = db.relationship('User', back_populates='progress', lazy='select')
+    recording = db.relationship('Recording', back_populates='progress', lazy='select')
+
 class Query(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id', ondelete='SET NULL'), nullable=True)
     message = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(20), default='Open') # Open, In Progress, Closed
+    status = db.Column(db.String(20), default='Open', index=True) # Open, In Progress, Closed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user = db.relationship('User', backref='queries', lazy=True)
-    batch = db.relationship('Batch', backref='queries', lazy=True)
+    user = db.relationship('User', back_populates='queries', lazy='joined')
+    batch = db.relationship('Batch', back_populates='queries', lazy='select')
 
 class OTP_Token(db.Model): # NEW MODEL FOR OTP
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), index=True, nullable=False)
     token = db.Column(db.String(10), nullable=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, index=True, nullable=False)
     
 # ---------------- Database Initialization Function (CRITICAL FOR RENDER) ----------------
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    i = filename.rfind('.')
+    return i >= 0 and filename[i+1:].lower() in ALLOWED_EXT_FS
+
+def remove_duplicate_rows(conn, table, *columns):
+    # Before a unique index existed, racing requests could insert the same pair twice; keep the oldest row of each pair
+    cols = [table.c[name] for name in columns]
+    dup = table.alias()
+    keep = db.select(func.min(dup.c.id)).group_by(*(dup.c[name] for name in columns))
+    duplicate = db.and_(*(c.isnot(None) for c in cols), table.c.id.notin_(keep))
+    removed_ids = conn.execute(db.select(table.c.id).where(duplicate).order_by(table.c.id)).scalars().all()
+    if not removed_ids:
+        return
+    kept_ids = conn.execute(keep.where(*(dup.c[name].isnot(None) for name in columns)).having(func.count() > 1)
+                            .order_by(func.min(dup.c.id))).scalars().all()
+    if table is StudentProgress.__table__:
+        # Don't lose a completion that was recorded on one of the dropped rows
+        o = table.alias()
+        same = db.and_(*(o.c[name] == table.c[name] for name in columns), o.c.completed.is_(True))
+        conn.execute(db.update(table).where(table.c.id.in_(keep), db.exists().where(same))
+                     .values(completed=True, completed_at=db.select(func.max(o.c.completed_at)).where(same).scalar_subquery()))
+    conn.execute(db.delete(table).where(table.c.id.in_(removed_ids)))
+    print(f"WARNING: Removed duplicate {table.name} rows {removed_ids} before creating their unique index; kept rows {kept_ids}.")
+
+# Unique indexes added after the fact whose duplicates can safely be collapsed first
+DEDUPE_BEFORE_INDEX = {'ix_enroll_user_batch', 'ix_sp_user_rec'}
+
+def ensure_indexes():
+    # create_all() only runs on an empty database, so add indexes declared on the models later on
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                with db.engine.begin() as conn:
+                    if index.name in DEDUPE_BEFORE_INDEX:
+                        remove_duplicate_rows(conn, table, *(c.name for c in index.columns))
+                    index.create(conn)
+            except Exception as e:
+                if index.unique:
+                    # Upserts (ON CONFLICT) and duplicate checks depend on these, so say so loudly but keep the app up
+                    print(f"ERROR: Could not create unique index {index.name} on {table.name}; writes relying on it will fail until it exists: {e}")
+                else:
+                    print(f"WARNING: Could not create index {index.name} on {table.name}: {e}")
+
+def ensure_trainer_user_link():
+    # Older databases link trainers to their login only by email; add trainer.user_id and backfill it
+    columns = {c['name'] for c in db.inspect(db.engine).get_columns('trainer')}
+    if 'user_id' in columns:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE trainer ADD COLUMN user_id INTEGER REFERENCES "user" (id) ON DELETE SET NULL'))
+        conn.execute(text('UPDATE trainer SET user_id = (SELECT id FROM "user" WHERE "user".email = trainer.email)'))
+    print("Linked existing trainers to their user accounts (trainer.user_id).")
+
+def stale_foreign_key_tables():
+    # ON DELETE rules only exist on tables created after they were declared; find the tables still missing them
+    inspector = db.inspect(db.engine)
+    stale = []
+    for table in db.metadata.sorted_tables:
+        if db.engine.dialect.name == 'sqlite':
+            # Reflection misses rules on columns added by ALTER TABLE (e.g. trainer.user_id), so ask SQLite directly
+            with db.engine.connect() as conn:
+                existing = {(row[3],): row[6] for row in conn.execute(text(f'PRAGMA foreign_key_list("{table.name}")'))}
+        else:
+            existing = {tuple(fk['constrained_columns']): (fk.get('options') or {}).get('ondelete') for fk in inspector.get_foreign_keys(table.name)}
+        if any(fk.ondelete and (existing.get((fk.parent.name,)) or '').upper() != fk.ondelete for fk in table.foreign_keys):
+            stale.append(table)
+    return stale
+
+def backup_sqlite_database():
+    # Copy the database file aside before the foreign key migration rewrites tables and deletes orphan rows
+    path = db.engine.url.database
+    if not path or path == ':memory:':
+        return
+    backup_path = f"{path}.{datetime.utcnow():%Y%m%d%H%M%S}.bak"
+    raw = db.engine.raw_connection()
+    try:
+        target = sqlite3.connect(backup_path)
+        try:
+            raw.driver_connection.backup(target)
+        finally:
+            target.close()
+    finally:
+        raw.close()
+    print(f"Backed up the database to {backup_path} before migrating its foreign keys.")
+
+def remove_orphan_rows(conn, stale):
+    # The old schema never enforced the ON DELETE rules; apply them to rows left pointing at deleted parents
+    for table in stale:
+        for fk in table.foreign_keys:
+            if not fk.ondelete:
+                continue
+            col = table.c[fk.parent.name]
+            orphan = col.isnot(None) & col.notin_(db.select(fk.column))
+            if fk.ondelete == 'CASCADE':
+                deleted = conn.execute(db.delete(table).where(orphan)).rowcount
+                if deleted:
+                    print(f"Deleted {deleted} {table.name} rows whose {col.name} pointed at a missing {fk.column.table.name} row.")
+            else:
+                cleared = conn.execute(db.update(table).where(orphan).values({col.name: None})).rowcount
+                if cleared:
+                    print(f"Cleared {table.name}.{col.name} on {cleared} rows whose {fk.column.table.name} row no longer exists.")
+
+def ensure_foreign_keys():
+    # Deletes rely on the database cascading (passive_deletes, Core deletes), so older tables are migrated to the declared rules
+    stale = stale_foreign_key_tables()
+    if not stale:
+        return
+    names = ', '.join(t.name for t in stale)
+    quote = db.engine.dialect.identifier_preparer.quote
+    inspector = db.inspect(db.engine)
+    if db.engine.dialect.name == 'sqlite':
+        try:
+            backup_sqlite_database()
+        except Exception as e:
+            print(f"WARNING: Could not back up the database, leaving the foreign keys of {names} as they are: {e}")
+            return
+    elif not MIGRATE_FOREIGN_KEYS:
+        # There is no file to copy here, so only touch the constraints (and orphan rows) once someone opts in
+        print(f"WARNING: The foreign keys of {names} lack their ON DELETE rules; back up the database and restart with MIGRATE_FOREIGN_KEYS=True to migrate them.")
+        return
+    with db.engine.connect() as conn:
+        if db.engine.dialect.name == 'sqlite':
+            # SQLite cannot alter a constraint: copy each table into a freshly created one and swap it in
+            conn.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            try:
+                for table in stale:
+                    old_columns = {c['name'] for c in inspector.get_columns(table.name)}
+                    columns = ', '.join(quote(c.name) for c in table.columns if c.name in old_columns)
+                    tmp_name = quote(f'_rebuild_{table.name}')
+                    ddl = str(CreateTable(table).compile(dialect=db.engine.dialect))
+                    conn.exec_driver_sql(ddl.replace(f'CREATE TABLE {quote(table.name)} ', f'CREATE TABLE {tmp_name} ', 1))
+                    conn.exec_driver_sql(f'INSERT INTO {tmp_name} ({columns}) SELECT {columns} FROM {quote(table.name)}')
+                    conn.exec_driver_sql(f'DROP TABLE {quote(table.name)}')
+                    conn.exec_driver_sql(f'ALTER TABLE {tmp_name} RENAME TO {quote(table.name)}')
+                conn.commit()
+            finally:
+                conn.exec_driver_sql('PRAGMA foreign_keys=ON')
+            remove_orphan_rows(conn, stale)
+        else:
+            for table in stale:
+                for fk in inspector.get_foreign_keys(table.name):
+                    if fk['name']:
+                        conn.execute(text(f'ALTER TABLE {quote(table.name)} DROP CONSTRAINT {quote(fk["name"])}'))
+            # Orphans first, otherwise adding the constraints back fails validation
+            remove_orphan_rows(conn, stale)
+            for table in stale:
+                for constraint in table.foreign_key_constraints:
+                    conn.execute(AddConstraint(constraint))
+        conn.commit()
+    print(f"Migrated foreign keys to their ON DELETE rules: {names}")
 
 def initialize_database(app):
     with app.app_context():
@@ -184,54 +408,116 @@ def initialize_database(app):
                 print('Created default admin: admin@lms.com / admin123')
         else:
             print("Database structure found. Continuing...")
+            ensure_trainer_user_link()
+            ensure_foreign_keys()
+            ensure_indexes()
 
 # Run the initialization function immediately after setup
 initialize_database(app)
 
 # ---------------- Helpers ----------------
+def send_email_async(app, msg):
+    # Runs on EXECUTOR, so a failure can only be logged, not flashed
+    with app.app_context():
+        try:
+            mail.send(msg)
+        except Exception as e:
+            print(f"EMAIL SENDING FAILED: {e}")
+
+def publish_profile_pic(app, part_path, filename, user_id, trainer_id=None):
+    # Runs on PROFILE_PIC_EXECUTOR: move the fully written upload into place, then point the profile at it
+    try:
+        os.replace(part_path, PROFILE_PICS_DIR / filename)
+    except OSError as e:
+        print(f"PROFILE PIC SAVE FAILED: {e}")
+        part_path.unlink(missing_ok=True)
+        return
+    with app.app_context():
+        db.session.execute(db.update(User).where(User.id == user_id).values(profile_pic=filename))
+        if trainer_id:
+            db.session.execute(db.update(Trainer).where(Trainer.id == trainer_id).values(profile_pic=filename))
+        db.session.commit()
+
 def generate_and_send_otp(user_id, email):
     # Generates a 6-char hex token and sets expiry (e.g., 10 minutes)
     token = secrets.token_hex(3).upper() 
     expires = datetime.utcnow() + timedelta(minutes=10)
     
-    # Clear old tokens for this user
-    OTP_Token.query.filter_by(user_id=user_id).delete()
+    # Clear old tokens for this user (single bulk DELETE, no ORM session sync)
+    db.session.execute(db.delete(OTP_Token).where(OTP_Token.user_id == user_id))
     
     otp_entry = OTP_Token(user_id=user_id, token=token, expires_at=expires)
     db.session.add(otp_entry)
     db.session.commit()
     
     # --- ACTUAL EMAIL SENDING LOGIC ---
-    try:
-        msg = Message("LMS Password Reset Code", recipients=[email])
-        msg.body = f"Your One-Time Password for password reset is: {token}. It is valid for 10 minutes."
-        mail.send(msg)
-        flash(f"A recovery code has been sent to {email}. (Valid for 10 minutes).", 'warning')
-        return token
-    except Exception as e:
-        # If email fails, still proceed but alert the developer/user (Optional)
-        print(f"EMAIL SENDING FAILED: {e}") 
+    if not app.config['MAIL_USERNAME']:
+        # Mail is not configured, so nothing can be sent: still proceed but alert the developer/user
         flash("Email sending failed. Please check your MAIL_USERNAME/PASSWORD or try again later.", 'danger')
         flash(f"FOR DEV TESTING: Your OTP is {token}", 'info')
         return None 
+    
+    msg = Message("LMS Password Reset Code", recipients=[email])
+    msg.body = f"Your One-Time Password for password reset is: {token}. It is valid for 10 minutes."
+    # The SMTP round-trip happens in the background so the request returns right after the commit
+    EXECUTOR.submit(send_email_async, app, msg)
+    flash(f"A recovery code has been sent to {email}. (Valid for 10 minutes).", 'warning')
+    return token
+
+def fast_count(model, *criteria, **filters):
+    # Plain SELECT COUNT(*) rather than Query.count()'s subquery wrapper
+    return db.session.query(func.count(model.id)).select_from(model).filter(*criteria).filter_by(**filters).scalar() or 0
+
+# In-process cache for admin_metrics(); cleared by any route that adds or removes students, batches or trainers
+_metrics_cache = {}
+
+def admin_metrics():
+    cached = _metrics_cache.get('metrics')
+    if cached and time.monotonic() - cached[0] < ADMIN_METRICS_TTL:
+        return cached[1]
+    
+    one_week_ago = datetime.utcnow() - timedelta(days=7)
+    metrics = dict(students_count=fast_count(User, role='student'),
+                   batches_count=fast_count(Batch),
+                   trainers_count=fast_count(Trainer),
+                   new_students_count=fast_count(User, User.created_at >= one_week_ago, role='student'),
+                   pending_queries_count=fast_count(Query, status='Open'))
+    _metrics_cache['metrics'] = (time.monotonic(), metrics)
+    return metrics
+
+def eager_options(*options):
+    # In debug mode, any relationship a query did not eager-load raises instead of silently lazy-loading (N+1 guard)
+    if app.debug:
+        return options + (raiseload('*'),)
+    return options
 
 # ---------------- Context helpers ----------------
-@app.context_processor
-def inject_helpers():
-    def current_user():
+def current_user():
+    # Load the logged-in user on first use and memoize it on g for the rest of the request,
+    # so requests that never ask (static files, login page) never issue the SELECT
+    if 'user' not in g:
         uid = session.get('user_id')
-        if not uid:
-            return None
-        return User.query.get(uid)
-    
-    def is_admin():
-        u = current_user()
-        return u and u.role == 'admin'
-    
-    def is_trainer():
-        u = current_user()
-        return u and u.role == 'trainer'
+        g.user = db.session.get(User, uid) if uid else None
+    return g.user
+
+def is_admin():
+    u = current_user()
+    return u and u.role == 'admin'
 
+def is_trainer():
+    u = current_user()
+    return u and u.role == 'trainer'
+
+def admin_required(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            abort(403)
+        return fn(*args, **kwargs)
+    return wrapper
+
+@app.context_processor
+def inject_helpers():
     return dict(current_user=current_user, is_admin=is_admin, is_trainer=is_trainer)
 
 # ---------------- Routes ----------------
@@ -263,6 +549,7 @@ def register():
         u.set_password(password)
         db.session.add(u)
         db.session.commit()
+        _metrics_cache.clear()
         flash('Account created. Please login.','success')
         return redirect(url_for('login'))
 
@@ -357,38 +644,28 @@ def dashboard():
         flash('Login first', 'danger')
         return redirect(url_for('login'))
     
-    u = User.query.get(uid)
+    u = current_user()
     
     if u.role == 'admin':
-        students = User.query.filter(User.role == 'student').all()
-        batches = Batch.query.all()
-        trainers = Trainer.query.all()
-        
         # --- ADMIN METRICS ---
         unassigned_batches = Batch.query.filter(Batch.trainer_id == None).all()
-        one_week_ago = datetime.utcnow() - timedelta(days=7)
-        new_students_count = User.query.filter(User.role == 'student', User.created_at >= one_week_ago).count()
-        pending_queries_count = Query.query.filter_by(status='Open').count() 
         
         return render_template('admin_metrics.html', 
-                               students=students, 
-                               batches=batches, 
-                               trainers=trainers,
                                unassigned_batches=unassigned_batches,
-                               new_students_count=new_students_count,
-                               pending_queries_count=pending_queries_count) 
+                               **admin_metrics()) 
     
     elif u.role == 'trainer':
-        trainer = Trainer.query.filter_by(email=u.email).first()
+        # Batches are listed; their recordings are only counted below
+        trainer = Trainer.query.options(selectinload(Trainer.batches)).filter_by(user_id=u.id).first()
         if not trainer:
             flash('Trainer profile link broken. Please contact admin.', 'danger')
             return redirect(url_for('logout'))
             
-        batches = Batch.query.filter_by(trainer_id=trainer.id).all()
+        batches = trainer.batches
         assigned_batch_ids = [b.id for b in batches] 
         
         trainer_queries = Query.query.filter(Query.batch_id.in_(assigned_batch_ids), Query.status=='Open').order_by(Query.created_at.asc()).all() 
-        total_recordings_assigned = sum(len(b.recordings) for b in batches)
+        total_recordings_assigned = db.session.query(func.count(Recording.id)).filter(Recording.batch_id.in_(assigned_batch_ids)).scalar() or 0
         
         return render_template('trainer_dashboard.html', 
                                trainer=trainer, 
@@ -397,7 +674,11 @@ def dashboard():
                                trainer_queries=trainer_queries) 
         
     else: # Student
-        enrollments = Enrollment.query.filter_by(user_id=u.id).all()
+        enrollments = Enrollment.query.options(*eager_options(selectinload(Enrollment.batch).selectinload(Batch.recordings))).filter_by(user_id=u.id).all()
+        
+        # Fetch every completed recording id once instead of querying per enrollment/recording
+        completed_rows = db.session.query(StudentProgress.recording_id).filter_by(user_id=u.id, completed=True).all()
+        completed_ids = {r[0] for r in completed_rows}
         
         # Student Metrics: Calculate overall progress and next lesson
         total_available = 0
@@ -408,7 +689,7 @@ def dashboard():
             all_recordings = e.batch.recordings
             total_recordings = len(all_recordings)
             
-            completed_recordings = StudentProgress.query.filter_by(user_id=u.id, completed=True).join(Recording).filter(Recording.batch_id == e.batch.id).count()
+            completed_recordings = sum(1 for r in all_recordings if r.id in completed_ids)
             
             e.progress_count = f"{completed_recordings}/{total_recordings}"
             total_available += total_recordings
@@ -417,8 +698,7 @@ def dashboard():
             # Determine Next Lesson (find the first uncompleted recording)
             if next_lesson is None:
                 for rec in all_recordings:
-                    progress = StudentProgress.query.filter_by(user_id=u.id, recording_id=rec.id, completed=True).first()
-                    if not progress:
+                    if rec.id not in completed_ids:
                         next_lesson = {'batch_name': e.batch.name, 'recording_name': rec.original_name, 'recording_id': rec.id, 'batch_id': e.batch.id}
                         break
                 
@@ -430,9 +710,8 @@ def dashboard():
                                next_lesson=next_lesson)
 
 @app.route('/admin_dashboard')
+@admin_required
 def admin_dashboard():
-    if not inject_helpers()['is_admin']():
-        abort(403)
     students = User.query.filter(User.role == 'student').all()
     batches = Batch.query.all()
     trainers = Trainer.query.all()
@@ -440,30 +719,29 @@ def admin_dashboard():
     return render_template('admin_dashboard.html', students=students, batches=batches, trainers=trainers)
 
 @app.route('/view_all_batches')
+@admin_required
 def view_all_batches():
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    batches = Batch.query.all()
+    page = request.args.get('page', 1, type=int)
+    batches = Batch.query.order_by(Batch.created_at.desc()).paginate(page=page, per_page=PER_PAGE, error_out=False)
     return render_template('view_all_batches.html', batches=batches)
 
 @app.route('/view_all_students')
+@admin_required
 def view_all_students():
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    students = User.query.filter(User.role == 'student').all()
+    page = request.args.get('page', 1, type=int)
+    students = User.query.options(selectinload(User.enrollments).selectinload(Enrollment.batch)).filter_by(role='student').order_by(User.created_at.desc()).paginate(page=page, per_page=PER_PAGE, error_out=False)
     return render_template('view_all_students.html', students=students)
 
 @app.route('/view_all_trainers')
+@admin_required
 def view_all_trainers():
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    trainers = Trainer.query.all()
+    page = request.args.get('page', 1, type=int)
+    trainers = Trainer.query.options(selectinload(Trainer.batches)).order_by(Trainer.id).paginate(page=page, per_page=PER_PAGE, error_out=False)
     return render_template('view_all_trainers.html', trainers=trainers)
 
 @app.route('/create_batch', methods=['POST'])
+@admin_required
 def create_batch():
-    if not inject_helpers()['is_admin']():
-        abort(403)
     name = request.form['name']
     desc = request.form.get('description')
     if Batch.query.filter_by(name=name).first():
@@ -472,29 +750,29 @@ def create_batch():
         b = Batch(name=name, description=desc)
         db.session.add(b)
         db.session.commit()
+        _metrics_cache.clear()
         flash('Batch created successfully','success')
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/delete_batch/<int:batch_id>')
+@admin_required
 def delete_batch(batch_id):
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    b = Batch.query.get_or_404(batch_id)
+    b = db.get_or_404(Batch, batch_id)
     folder = UPLOAD_ROOT / str(b.id)
-    if folder.exists():
-        for f in folder.iterdir(): os.remove(f)
-        os.rmdir(folder)
-    db.session.delete(b)
+    # Recordings, enrollments and their progress rows go with the batch via ON DELETE CASCADE
+    db.session.execute(db.delete(Batch).where(Batch.id == b.id))
     db.session.commit()
+    # Only remove the files once the rows are gone; a failed delete must not orphan the recordings
+    if folder.exists():
+        EXECUTOR.submit(shutil.rmtree, folder, ignore_errors=True)
+    _metrics_cache.clear()
     flash('Batch deleted','info')
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/edit_batch/<int:batch_id>', methods=['GET', 'POST'])
+@admin_required
 def edit_batch(batch_id):
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    
-    batch = Batch.query.get_or_404(batch_id)
+    batch = db.get_or_404(Batch, batch_id)
 
     if request.method == 'POST':
         new_name = request.form['name']
@@ -514,10 +792,8 @@ def edit_batch(batch_id):
     return render_template('edit_batch.html', batch=batch)
 
 @app.route('/enroll_student', methods=['POST'])
+@admin_required
 def enroll_student():
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    
     user_id_str = request.form.get('user_id')
     batch_id_str = request.form.get('batch_id')
     
@@ -537,17 +813,24 @@ def enroll_student():
     if Enrollment.query.filter_by(user_id=user_id, batch_id=batch_id).first():
         flash('Student already enrolled','info')
     else:
-        e = Enrollment(user_id=user_id, batch_id=batch_id)
-        db.session.add(e)
-        db.session.commit()
-        flash('Student enrolled','success')
+        try:
+            e = Enrollment(user_id=user_id, batch_id=batch_id)
+            db.session.add(e)
+            db.session.commit()
+            flash('Student enrolled','success')
+        except IntegrityError:
+            db.session.rollback()
+            # Either the user/batch foreign key failed, or a concurrent request enrolled the same student first
+            if db.session.get(User, user_id) is None or db.session.get(Batch, batch_id) is None:
+                flash('Invalid selection', 'danger')
+            else:
+                flash('Student already enrolled','info')
         
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/create_trainer', methods=['POST'])
+@admin_required
 def create_trainer():
-    if not inject_helpers()['is_admin']():
-        abort(403)
     name = request.form['name']
     email = request.form['email']
     expertise = request.form.get('expertise', '')
@@ -563,13 +846,14 @@ def create_trainer():
         return redirect(url_for('admin_dashboard'))
     
     try:
-        trainer = Trainer(name=name, email=email, expertise=expertise)
         trainer_user = User(name=name, email=email, role='trainer')
+        trainer = Trainer(name=name, email=email, expertise=expertise, user=trainer_user)
         trainer_user.set_password('trainer123')
         
         db.session.add(trainer)
         db.session.add(trainer_user)
         db.session.commit()
+        _metrics_cache.clear()
         
         flash("Trainer and user account created successfully! Default password is 'trainer123'.", "success")
     except Exception as e:
@@ -579,14 +863,20 @@ def create_trainer():
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/assign_trainer', methods=['POST'])
+@admin_required
 def assign_trainer():
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    batch_id = request.form['batch_id']
-    trainer_id = request.form['trainer_id']
+    try:
+        batch_id = int(request.form.get('batch_id'))
+        trainer_id = int(request.form.get('trainer_id'))
+    except (TypeError, ValueError):
+        flash("Invalid batch or trainer selection.", 'danger')
+        return redirect(url_for('admin_dashboard'))
 
-    batch = Batch.query.get_or_404(batch_id)
-    trainer = Trainer.query.get_or_404(trainer_id)
+    # Batch (its current trainer comes along via lazy='joined') and the new trainer in a single query
+    row = db.session.query(Batch, Trainer).join(Trainer, Trainer.id == trainer_id).filter(Batch.id == batch_id).one_or_none()
+    if row is None:
+        abort(404)
+    batch, trainer = row
     
     # 1. Check if the assigned trainer is the one currently in place
     if batch.trainer_id == trainer.id:
@@ -597,24 +887,22 @@ def assign_trainer():
     elif batch.trainer_id is not None and batch.trainer_id != trainer.id:
         # If a different trainer is assigned, proceed with replacement and inform the admin.
         old_trainer_name = batch.trainer.name
-        batch.trainer_id = trainer_id
+        batch.trainer_id = trainer.id
         db.session.commit()
         flash(f"Trainer {old_trainer_name} has been replaced by {trainer.name} for batch {batch.name}.", 'warning')
         return redirect(url_for('admin_dashboard'))
     
     # 3. No trainer currently assigned, assign the new one
     else:
-        batch.trainer_id = trainer_id
+        batch.trainer_id = trainer.id
         db.session.commit()
         flash(f"Trainer {trainer.name} assigned to batch {batch.name} successfully!", "success")
         return redirect(url_for('admin_dashboard'))
 
 @app.route('/batch/<int:batch_id>/change_trainer', methods=['GET', 'POST'])
+@admin_required
 def change_batch_trainer(batch_id):
-    if not inject_helpers()['is_admin']():
-        abort(403)
-        
-    batch = Batch.query.get_or_404(batch_id)
+    batch = db.get_or_404(Batch, batch_id, options=[joinedload(Batch.trainer)])
     trainers = Trainer.query.all()
 
     if request.method == 'POST':
@@ -632,7 +920,7 @@ def change_batch_trainer(batch_id):
 
         try:
             new_trainer_id = int(trainer_id)
-            new_trainer = Trainer.query.get(new_trainer_id)
+            new_trainer = db.session.get(Trainer, new_trainer_id)
             if not new_trainer:
                 flash("Selected trainer not found.", 'danger')
                 return redirect(url_for('change_batch_trainer', batch_id=batch.id))
@@ -665,36 +953,36 @@ def change_batch_trainer(batch_id):
 @app.route('/batch/<int:batch_id>')
 def view_batch(batch_id):
     uid = session.get('user_id')
-    batch = Batch.query.get_or_404(batch_id)
+    batch = Batch.query.options(*eager_options(joinedload(Batch.trainer), selectinload(Batch.recordings))).filter_by(id=batch_id).first_or_404()
 
     # PUBLIC ACCESS: If not logged in, show the descriptive landing page
     if not uid:
         # Use a simple template for public view
         return render_template('public_batch_view.html', batch=batch)
         
-    user = User.query.get(uid)
-    recordings = Recording.query.filter_by(batch_id=batch.id).all()
+    user = current_user()
+    recordings = batch.recordings
     
     is_enrolled = Enrollment.query.filter_by(user_id=user.id, batch_id=batch_id).first() is not None
-    is_assigned_trainer = batch.trainer and batch.trainer.email == user.email
+    is_assigned_trainer = batch.trainer and batch.trainer.user_id == user.id
+    user_is_admin = user.role == 'admin'
 
-    if user.role == 'student' and not is_enrolled and not inject_helpers()['is_admin']():
+    if user.role == 'student' and not is_enrolled and not user_is_admin:
         flash('You are not enrolled in this batch.', 'danger')
         return redirect(url_for('dashboard'))
-    elif user.role == 'trainer' and not is_assigned_trainer and not inject_helpers()['is_admin']():
+    elif user.role == 'trainer' and not is_assigned_trainer and not user_is_admin:
         flash('You are not assigned to this batch.', 'danger')
         return redirect(url_for('dashboard'))
 
     # Get completion status for student
     progress_data = {}
     if user.role == 'student':
-        for r in recordings:
-            progress = StudentProgress.query.filter_by(user_id=user.id, recording_id=r.id).first()
-            progress_data[r.id] = progress.completed if progress else False
+        rows = db.session.query(StudentProgress.recording_id, StudentProgress.completed).filter(StudentProgress.user_id == user.id, StudentProgress.recording_id.in_([r.id for r in recordings])).all()
+        progress_data = {rid: done for rid, done in rows}
 
     # Define permissions based on user role
-    can_upload_delete = inject_helpers()['is_trainer']() and is_assigned_trainer
-    can_view_content = can_upload_delete or is_enrolled or inject_helpers()['is_admin']()
+    can_upload_delete = user.role == 'trainer' and is_assigned_trainer
+    can_view_content = can_upload_delete or is_enrolled or user_is_admin
 
     if not can_view_content:
         flash("You are not authorized to view this content.", 'danger')
@@ -713,12 +1001,12 @@ def upload(batch_id):
     # Only Admin and Assigned Trainer can reach this route based on UI, but only trainer can upload.
     # We restrict access immediately in the function body.
     
-    batch = Batch.query.get_or_404(batch_id)
-    user = inject_helpers()['current_user']()
-    is_assigned_trainer = batch.trainer and batch.trainer.email == user.email
+    batch = Batch.query.options(joinedload(Batch.trainer)).filter_by(id=batch_id).first_or_404()
+    user = current_user()
+    is_assigned_trainer = batch.trainer and batch.trainer.user_id == user.id
     
     # FINAL AUTHORIZATION CHECK: Must be an assigned trainer
-    if not (inject_helpers()['is_trainer']() and is_assigned_trainer):
+    if not (is_trainer() and is_assigned_trainer):
         flash("Only the assigned trainer can upload recordings to this batch.", 'danger')
         abort(403) # Return 403 Forbidden to the client
         
@@ -730,7 +1018,7 @@ def upload(batch_id):
         folder = UPLOAD_ROOT / str(batch.id)
         folder.mkdir(exist_ok=True)
         filepath = folder / filename
-        file.save(filepath)
+        file.save(filepath, buffer_size=UPLOAD_CHUNK_SIZE)
         r = Recording(filename=filename, original_name=file.filename, batch_id=batch.id, notes=notes)
         db.session.add(r)
         db.session.commit()
@@ -739,8 +1027,46 @@ def upload(batch_id):
         flash('Invalid file type or no file selected. Please check allowed formats.', 'danger')
     return redirect(url_for('view_batch', batch_id=batch.id))
 
+@app.route('/batch/<int:batch_id>/upload_stream', methods=['PUT'])
+def upload_stream(batch_id):
+    # Large recordings are sent as the raw request body and copied straight to disk,
+    # skipping Werkzeug's multipart parser. Small files still go through upload().
+    batch = Batch.query.options(joinedload(Batch.trainer)).filter_by(id=batch_id).first_or_404()
+    user = current_user()
+    
+    # FINAL AUTHORIZATION CHECK: Must be an assigned trainer
+    if not (is_trainer() and batch.trainer and batch.trainer.user_id == user.id):
+        return {"status": "error", "message": "Only the assigned trainer can upload recordings to this batch."}, 403
+    
+    original_name = unquote(request.headers.get('X-Filename', ''))
+    notes = unquote(request.headers.get('X-Notes', '')) or None
+    
+    if not original_name or not allowed_file(original_name):
+        return {"status": "error", "message": "Invalid file type or no file selected. Please check allowed formats."}, 400
+    
+    filename = secure_filename(original_name)
+    folder = UPLOAD_ROOT / str(batch.id)
+    folder.mkdir(exist_ok=True)
+    # Copy to a temporary name and only put it in place once the whole body arrived,
+    # so an aborted upload never leaves a partial file behind
+    part_path = folder / f'.{filename}.{secrets.token_hex(4)}.part'
+    try:
+        with open(part_path, 'wb') as f:
+            # A body shorter than its Content-Length raises ClientDisconnected here
+            shutil.copyfileobj(request.stream, f, length=UPLOAD_CHUNK_SIZE)
+        os.replace(part_path, folder / filename)
+    except Exception:
+        part_path.unlink(missing_ok=True)
+        raise
+    
+    r = Recording(filename=filename, original_name=original_name, batch_id=batch.id, notes=notes)
+    db.session.add(r)
+    db.session.commit()
+    flash('Uploaded successfully','success')
+    return {"status": "success", "message": "Uploaded successfully"}, 200
+
 @app.route('/uploads/<int:batch_id>/<filename>')
-def serve_content(batch_id, filename):
+def download(batch_id, filename):
     # Get the file's guessed MIME type
     mimetype = mimetypes.guess_type(filename)[0]
     
@@ -758,13 +1084,13 @@ def serve_content(batch_id, filename):
 
 @app.route('/delete_recording/<int:rec_id>')
 def delete_recording(rec_id):
-    r = Recording.query.get_or_404(rec_id)
+    r = Recording.query.options(joinedload(Recording.batch).joinedload(Batch.trainer)).filter_by(id=rec_id).first_or_404()
     batch = r.batch
-    user = inject_helpers()['current_user']()
-    is_assigned_trainer = batch.trainer and batch.trainer.email == user.email
+    user = current_user()
+    is_assigned_trainer = batch.trainer and batch.trainer.user_id == user.id
     
     # FINAL AUTHORIZATION CHECK: Must be an assigned trainer
-    if not (inject_helpers()['is_trainer']() and is_assigned_trainer):
+    if not (is_trainer() and is_assigned_trainer):
         flash("Only the assigned trainer can delete content.", 'danger')
         abort(403)
 
@@ -778,57 +1104,65 @@ def delete_recording(rec_id):
 
 @app.route('/batch/<int:batch_id>/enrollments')
 def view_batch_enrollments(batch_id):
-    if not (inject_helpers()['is_admin']() or inject_helpers()['is_trainer']()):
+    if not (is_admin() or is_trainer()):
         abort(403)
-    batch = Batch.query.get_or_404(batch_id)
-    enrollments = Enrollment.query.filter_by(batch_id=batch.id).order_by(Enrollment.enrolled_at.desc()).all()
+    batch = db.get_or_404(Batch, batch_id)
+    enrollments = Enrollment.query.options(*eager_options(selectinload(Enrollment.user))).filter_by(batch_id=batch.id).order_by(Enrollment.enrolled_at.desc()).all()
     
+    # Completed recordings per student in this batch, in one grouped query
+    total_recordings = fast_count(Recording, batch_id=batch.id)
+    counts = dict(db.session.query(StudentProgress.user_id, func.count(StudentProgress.id)).join(Recording).filter(Recording.batch_id == batch.id, StudentProgress.completed == True).group_by(StudentProgress.user_id).all())
     for e in enrollments:
-        total_recordings = len(batch.recordings)
-        completed_recordings = StudentProgress.query.filter_by(user_id=e.user.id, completed=True).join(Recording).filter(Recording.batch_id == batch.id).count()
-        e.progress = f"{completed_recordings} / {total_recordings}"
+        e.progress = f"{counts.get(e.user_id, 0)} / {total_recordings}"
     
     return render_template('batch_enrollments.html', batch=batch, enrollments=enrollments)
 
+def student_enrollments(student):
+    # One JOINed query fills Enrollment.batch; the page never shows the batch trainer, so skip its default join
+    return (Enrollment.query.join(Enrollment.batch).filter(Enrollment.user_id == student.id)
+            .options(*eager_options(contains_eager(Enrollment.batch).lazyload(Batch.trainer)))
+            .all())
+
 @app.route('/student/<int:user_id>/batches')
+@admin_required
 def view_student_batches(user_id):
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    student = User.query.get_or_404(user_id)
-    enrollments = Enrollment.query.filter_by(user_id=student.id).join(Batch).all()
+    student = db.get_or_404(User, user_id)
+    enrollments = student_enrollments(student)
     return render_template('student_batches.html', student=student, enrollments=enrollments)
 
 @app.route('/search_student_batches')
+@admin_required
 def search_student_batches():
-    if not inject_helpers()['is_admin']():
-        abort(403)
     query = request.args.get('query', '').strip()
+    # Look the student up by user ID or by email (an indexed equality lookup; any stored address matches)
     student = None
-    if '@' in query:
-        student = User.query.filter_by(email=query).first()
-    else:
-        if query.isdigit():
-            enrollment = Enrollment.query.get(int(query))
-            if enrollment:
-                student = enrollment.user
+    if query.isdigit():
+        student = User.query.filter_by(id=int(query), role='student').first()
+    elif query:
+        student = User.query.filter_by(email=query, role='student').first()
     if not student:
         flash('Student not found', 'danger')
         return redirect(url_for('admin_dashboard'))
-    enrollments = Enrollment.query.filter_by(user_id=student.id).join(Batch).all()
+    enrollments = student_enrollments(student)
     return render_template('student_batches.html', student=student, enrollments=enrollments)
 
 @app.route('/search_trainer')
+@admin_required
 def search_trainer():
-    if not inject_helpers()['is_admin']():
-        abort(403)
     query = request.args.get('query', '').strip()
-    trainer = None
+    if not query:
+        flash('Enter a trainer email or ID to search.', 'danger')
+        return redirect(url_for('admin_dashboard'))
     
-    if '@' in query:
-        trainer = Trainer.query.filter_by(email=query).first()
+    # Digits are a trainer ID, anything else an exact email; the result page lists the trainer's batches
+    trainers = Trainer.query.options(selectinload(Trainer.batches))
+    if query.isdigit():
+        trainer = trainers.filter_by(id=int(query)).first()
+    else:
+        trainer = trainers.filter_by(email=query).first()
     
     if not trainer:
-        flash('Trainer not found by email.', 'danger')
+        flash('Trainer not found by email or ID.', 'danger')
         return redirect(url_for('admin_dashboard'))
 
     # Trainer is found, render a results page.
@@ -836,10 +1170,9 @@ def search_trainer():
 
 
 @app.route('/delete_enrollment/<int:enroll_id>')
+@admin_required
 def delete_enrollment(enroll_id):
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    enrollment = Enrollment.query.get_or_404(enroll_id)
+    enrollment = db.get_or_404(Enrollment, enroll_id)
     db.session.delete(enrollment)
     db.session.commit()
     flash(f"Student {enrollment.user.name} removed from batch {enrollment.batch.name}", "success")
@@ -850,16 +1183,26 @@ def handle_profile_update(user, trainer=None):
     if 'profile_pic' in request.files:
         file = request.files['profile_pic']
         if file.filename != '' and file and allowed_file(file.filename):
-            prefix = 'trainer' if trainer else user.role
-            id_val = trainer.id if trainer else user.id
-            filename = secure_filename(f"{prefix}_{id_val}_{file.filename}")
-            PROFILE_PICS_DIR.mkdir(parents=True, exist_ok=True)
-            file.save(os.path.join(PROFILE_PICS_DIR, filename))
-            
-            # Update both user and trainer profiles if applicable
-            user.profile_pic = filename
-            if trainer:
-                trainer.profile_pic = filename
+            # The upload is already spooled by Werkzeug, so measuring it is a seek, not a read
+            size = file.stream.seek(0, os.SEEK_END)
+            file.stream.seek(0)
+            if size > MAX_PROFILE_PIC_SIZE:
+                flash(f'Profile picture must be {MAX_PROFILE_PIC_SIZE // (1024 * 1024)} MB or smaller; it was not changed.', 'warning')
+            else:
+                prefix = 'trainer' if trainer else user.role
+                id_val = trainer.id if trainer else user.id
+                filename = secure_filename(f"{prefix}_{id_val}_{file.filename}")
+                # Stream to a temporary name here; the worker renames it and only then records it on
+                # the user and trainer profiles, so they never point at a missing file
+                part_path = PROFILE_PICS_DIR / f'.{filename}.{secrets.token_hex(4)}.part'
+                try:
+                    file.save(part_path, buffer_size=UPLOAD_CHUNK_SIZE)
+                except OSError as e:
+                    print(f"PROFILE PIC SAVE FAILED: {e}")
+                    part_path.unlink(missing_ok=True)
+                    flash('Could not save the profile picture. Please try again.', 'danger')
+                else:
+                    PROFILE_PIC_EXECUTOR.submit(publish_profile_pic, app, part_path, filename, user.id, trainer.id if trainer else None)
 
     user.name = request.form['name']
     user.phone = request.form.get('phone')
@@ -880,7 +1223,7 @@ def handle_profile_update(user, trainer=None):
 # Route to handle email and password changes (Security)
 @app.route('/profile/security', methods=['POST'])
 def update_security():
-    user = inject_helpers()['current_user']()
+    user = current_user()
     if not user: abort(403)
     
     current_password = request.form['current_password']
@@ -912,7 +1255,7 @@ def update_security():
         
         # If Trainer, update Trainer email as well
         if user.role == 'trainer':
-            trainer = Trainer.query.filter_by(email=user.email).first()
+            trainer = user.trainer
             if trainer:
                 trainer.email = new_email
         
@@ -923,7 +1266,7 @@ def update_security():
 
 @app.route('/profile')
 def profile():
-    user = inject_helpers()['current_user']()
+    user = current_user()
     if not user:
         flash('Please log in to view your profile.', 'danger')
         return redirect(url_for('login'))
@@ -936,39 +1279,35 @@ def profile():
         return redirect(url_for('student_profile'))
 
 @app.route('/admin/profile', methods=['GET', 'POST'])
+@admin_required
 def admin_profile():
-    if not inject_helpers()['is_admin'](): abort(403)
-    user = inject_helpers()['current_user']()
+    user = current_user()
     if request.method == 'POST':
+        # Render the updated profile straight away instead of a redirect and a second GET
         handle_profile_update(user)
-        return redirect(url_for('admin_profile'))
     return render_template('admin_profile.html', user=user)
 
 @app.route('/trainer/profile', methods=['GET', 'POST'])
 def trainer_profile():
-    user = inject_helpers()['current_user']()
+    user = current_user()
     if not user or user.role != 'trainer': abort(403)
-    trainer = Trainer.query.filter_by(email=user.email).first_or_404()
+    trainer = user.trainer or abort(404)
     if request.method == 'POST':
         handle_profile_update(user, trainer=trainer)
-        return redirect(url_for('trainer_profile'))
     return render_template('trainer_profile.html', trainer=trainer, user=user)
 
 @app.route('/student/profile', methods=['GET', 'POST'])
 def student_profile():
-    user = inject_helpers()['current_user']()
+    user = current_user()
     if not user or user.role != 'student': abort(403)
     if request.method == 'POST':
         handle_profile_update(user)
-        return redirect(url_for('student_profile'))
     return render_template('student_profile.html', user=user)
 
 @app.route('/admin/change_password/<int:user_id>', methods=['GET', 'POST'])
+@admin_required
 def admin_change_password(user_id):
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    
-    student = User.query.get_or_404(user_id)
+    student = db.get_or_404(User, user_id)
 
     if request.method == 'POST':
         new_password = request.form['new_password']
@@ -982,66 +1321,79 @@ def admin_change_password(user_id):
 
     return render_template('change_password.html', student=student)
 
+# The progress API only ever answers with these two bodies, so they are serialized once.
+# A fresh Response is still built per call: a shared one would carry one request's cookies into the next.
+PROGRESS_OK_BODY = b'{"status": "success", "message": "Progress updated"}'
+PROGRESS_UNAUTHORIZED_BODY = b'{"status": "error", "message": "Unauthorized"}'
+PROGRESS_NOT_FOUND_BODY = b'{"status": "error", "message": "Recording not found"}'
+PROGRESS_BAD_REQUEST_BODY = b'{"status": "error", "message": "recording_id must be an integer"}'
+
 @app.route('/api/progress/update', methods=['POST'])
 def update_progress():
-    user = inject_helpers()['current_user']()
+    user = current_user()
     if not user or user.role != 'student':
-        return {"status": "error", "message": "Unauthorized"}, 401
-    
-    data = request.get_json()
-    recording_id = data.get('recording_id')
+        return Response(PROGRESS_UNAUTHORIZED_BODY, status=401, mimetype='application/json')
     
-    progress = StudentProgress.query.filter_by(user_id=user.id, recording_id=recording_id).first()
-    if not progress:
-        progress = StudentProgress(user_id=user.id, recording_id=recording_id)
-        db.session.add(progress)
-        
-    progress.completed = True
-    progress.completed_at = datetime.utcnow()
+    data = request.get_json(silent=True)
+    recording_id = data.get('recording_id') if isinstance(data, dict) else None
+    # bool is an int subclass, but true/false is not a recording
+    if not isinstance(recording_id, int) or isinstance(recording_id, bool):
+        return Response(PROGRESS_BAD_REQUEST_BODY, status=400, mimetype='application/json')
     
-    db.session.commit()
-    return {"status": "success", "message": "Progress updated"}, 200
+    # Single INSERT ... ON CONFLICT against ix_sp_user_rec instead of SELECT then INSERT/UPDATE
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    stmt = insert(StudentProgress).values(user_id=user.id, recording_id=recording_id, completed=True, completed_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'recording_id'],
+                                      set_={'completed': True, 'completed_at': stmt.excluded.completed_at})
+    try:
+        db.session.execute(stmt)
+        db.session.commit()
+    except IntegrityError:
+        # The recording_id foreign key is enforced, so an unknown recording is rejected here
+        db.session.rollback()
+        return Response(PROGRESS_NOT_FOUND_BODY, status=404, mimetype='application/json')
+    return Response(PROGRESS_OK_BODY, status=200, mimetype='application/json')
     
 @app.route('/delete_student/<int:user_id>')
+@admin_required
 def delete_student(user_id):
-    if not inject_helpers()['is_admin']():
-        abort(403)
-    user = User.query.get_or_404(user_id)
+    user = db.get_or_404(User, user_id)
     if user.role == 'admin':
         flash("Cannot delete an admin user.", "danger")
     else:
         db.session.delete(user)
         db.session.commit()
+        _metrics_cache.clear()
         flash(f"User {user.name} and all their enrollments have been deleted.", "success")
     return redirect(url_for('view_all_students'))
 
 @app.route('/delete_trainer/<int:trainer_id>')
+@admin_required
 def delete_trainer(trainer_id):
-    if not inject_helpers()['is_admin']():
-        abort(403)
-        
-    trainer = Trainer.query.get_or_404(trainer_id)
+    trainer = db.get_or_404(Trainer, trainer_id)
+    # The Core statements below bypass the ORM, so keep what we need from the row before it is gone
+    name, user_id, profile_pic = trainer.name, trainer.user_id, trainer.profile_pic
     
     # 1. Handle assigned batches: Unassign the trainer first.
-    Batch.query.filter_by(trainer_id=trainer.id).update({Batch.trainer_id: None})
+    db.session.execute(db.update(Batch).where(Batch.trainer_id == trainer.id).values(trainer_id=None)
+                       .execution_options(synchronize_session=False))
     
-    # 2. Find and delete the corresponding User account
-    user_to_delete = User.query.filter_by(email=trainer.email, role='trainer').first()
+    # 2. Delete the Trainer record, then the corresponding User account (no relationship loads)
+    db.session.execute(db.delete(Trainer).where(Trainer.id == trainer.id).execution_options(synchronize_session=False))
+    if user_id:
+        db.session.execute(db.delete(User).where(User.id == user_id).execution_options(synchronize_session=False))
     
     # 3. Delete profile picture (optional but good practice)
-    if trainer.profile_pic:
-        pic_path = PROFILE_PICS_DIR / trainer.profile_pic
+    if profile_pic:
+        pic_path = PROFILE_PICS_DIR / profile_pic
         if pic_path.exists():
             os.remove(pic_path)
 
-    # 4. Delete Trainer and User records
-    if user_to_delete:
-        db.session.delete(user_to_delete)
-        
-    db.session.delete(trainer)
+    # 4. All three statements share one COMMIT
     db.session.commit()
+    _metrics_cache.clear()
     
-    flash(f"Trainer '{trainer.name}' and their corresponding user account have been deleted.", "success")
+    flash(f"Trainer '{name}' and their corresponding user account have been deleted.", "success")
     return redirect(url_for('view_all_trainers'))
 
 # NEW ROUTE FOR EMBEDDED YOUTUBE/VIDEO SEARCH
@@ -1083,6 +1435,9 @@ def initialize_database(app):
                 print('Created default admin: admin@lms.com / admin123')
         else:
             print("Database structure found. Continuing...")
+            ensure_trainer_user_link()
+            ensure_foreign_keys()
+            ensure_indexes()
 
 # Run the initialization function immediately after setup
 initialize_database(app)
@@ -0,0 +1,101 @@
+import contextlib
+import os
+import pathlib
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+# lms.py configures its database when it is imported, so point it at a scratch SQLite file first
+TMP_DIR = pathlib.Path(tempfile.mkdtemp(prefix='lms-tests-'))
+os.environ['DATABASE_URL'] = f'sqlite:///{TMP_DIR / "lms.db"}'
+os.environ.pop('MAIL_USERNAME', None)
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import lms  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    lms.UPLOAD_ROOT = TMP_DIR / 'uploads'
+    lms.PROFILE_PICS_DIR = TMP_DIR / 'profiles'
+    lms.UPLOAD_ROOT.mkdir(exist_ok=True)
+    lms.PROFILE_PICS_DIR.mkdir(exist_ok=True)
+    lms.app.config['TESTING'] = True
+    return lms.app
+
+
+@pytest.fixture(scope='session')
+def data(app):
+    # Two batches of different sizes, so a per-row query shows up as a count that grows with the data
+    with app.app_context():
+        trainer_user = lms.User(name='Trainer', email='trainer@lms.com', role='trainer')
+        trainer_user.set_password('trainer123')
+        trainer = lms.Trainer(name='Trainer', email='trainer@lms.com', user=trainer_user)
+        small = lms.Batch(name='Small batch', trainer=trainer)
+        large = lms.Batch(name='Large batch', trainer=trainer)
+        for batch in (small, large):
+            batch.recordings = [lms.Recording(filename=f'r{n}.mp4', original_name=f'r{n}.mp4') for n in range(3)]
+        students = []
+        for n in range(5):
+            student = lms.User(name=f'Student {n}', email=f'student{n}@lms.com', role='student')
+            student.set_password('student123')
+            students.append(student)
+        lms.db.session.add_all([trainer_user, trainer, small, large] + students)
+        lms.db.session.flush()
+
+        lms.db.session.add(lms.Enrollment(user=students[0], batch=small))
+        for student in students:
+            lms.db.session.add(lms.Enrollment(user=student, batch=large))
+            lms.db.session.add(lms.StudentProgress(user_id=student.id, recording_id=large.recordings[0].id, completed=True))
+        lms.db.session.commit()
+        return {
+            'small_batch': small.id,
+            'large_batch': large.id,
+            'recording': small.recordings[0].id,
+            'students': [s.id for s in students],
+        }
+
+
+def login(app, email, password):
+    client = app.test_client()
+    response = client.post('/login', data={'email': email, 'password': password})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def admin_client(app, data):
+    return login(app, 'admin@lms.com', 'admin123')
+
+
+@pytest.fixture
+def student_client(app, data):
+    return login(app, 'student0@lms.com', 'student123')
+
+
+@pytest.fixture
+def trainer_client(app, data):
+    return login(app, 'trainer@lms.com', 'trainer123')
+
+
+@pytest.fixture
+def count_queries(app):
+    # Collects every SQL statement sent to the database inside the with-block
+    @contextlib.contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = lms.db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counter
@@ -0,0 +1,30 @@
+import lms
+
+
+def last_flash(client):
+    with client.session_transaction() as session:
+        return session.pop('_flashes', [])[-1][1]
+
+
+def test_assign_trainer_rejects_bad_ids(app, admin_client, data):
+    with app.app_context():
+        trainer_id = lms.Trainer.query.filter_by(email='trainer@lms.com').one().id
+
+    for form in ({'batch_id': 'x', 'trainer_id': trainer_id}, {'batch_id': data['small_batch']}):
+        response = admin_client.post('/assign_trainer', data=form)
+        assert response.status_code == 302
+        assert last_flash(admin_client) == 'Invalid batch or trainer selection.'
+
+    response = admin_client.post('/assign_trainer', data={'batch_id': data['small_batch'], 'trainer_id': trainer_id})
+    assert response.status_code == 302
+    assert last_flash(admin_client) == 'Trainer Trainer is already assigned to batch Small batch.'
+
+
+def test_enroll_student_unknown_ids(admin_client, data):
+    for form in ({'user_id': 9999, 'batch_id': data['small_batch']}, {'user_id': data['students'][1], 'batch_id': 9999}):
+        response = admin_client.post('/enroll_student', data=form)
+        assert response.status_code == 302
+        assert last_flash(admin_client) == 'Invalid selection'
+
+    response = admin_client.post('/enroll_student', data={'user_id': data['students'][0], 'batch_id': data['small_batch']})
+    assert last_flash(admin_client) == 'Student already enrolled'
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import lms
+
+# The tables as the first release created them, without any ON DELETE rules
+BASELINE_SCHEMA = '''
+CREATE TABLE user (
+    id INTEGER NOT NULL, name VARCHAR(150) NOT NULL, email VARCHAR(150) NOT NULL,
+    password_hash VARCHAR(300) NOT NULL, role VARCHAR(20), created_at DATETIME,
+    profile_pic VARCHAR(200), phone VARCHAR(20), address VARCHAR(200), about TEXT,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_user_email ON user (email);
+CREATE TABLE trainer (
+    id INTEGER NOT NULL, name VARCHAR(120) NOT NULL, email VARCHAR(120) NOT NULL,
+    expertise VARCHAR(200), profile_pic VARCHAR(200), phone VARCHAR(20), address VARCHAR(200), about TEXT,
+    PRIMARY KEY (id), UNIQUE (email)
+);
+CREATE TABLE batch (
+    id INTEGER NOT NULL, name VARCHAR(200) NOT NULL, description TEXT, created_at DATETIME, trainer_id INTEGER,
+    PRIMARY KEY (id), UNIQUE (name), FOREIGN KEY(trainer_id) REFERENCES trainer (id)
+);
+CREATE TABLE otp__token (
+    id INTEGER NOT NULL, user_id INTEGER NOT NULL, token VARCHAR(10) NOT NULL, expires_at DATETIME NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE enrollment (
+    id INTEGER NOT NULL, user_id INTEGER, batch_id INTEGER, enrolled_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id), FOREIGN KEY(batch_id) REFERENCES batch (id)
+);
+CREATE INDEX ix_enrollment_user_id ON enrollment (user_id);
+CREATE INDEX ix_enrollment_batch_id ON enrollment (batch_id);
+CREATE TABLE recording (
+    id INTEGER NOT NULL, filename VARCHAR(500) NOT NULL, original_name VARCHAR(500) NOT NULL,
+    upload_time DATETIME, batch_id INTEGER, notes TEXT,
+    PRIMARY KEY (id), FOREIGN KEY(batch_id) REFERENCES batch (id)
+);
+CREATE TABLE "query" (
+    id INTEGER NOT NULL, user_id INTEGER NOT NULL, batch_id INTEGER, message TEXT NOT NULL,
+    status VARCHAR(20), created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id), FOREIGN KEY(batch_id) REFERENCES batch (id)
+);
+CREATE TABLE student_progress (
+    id INTEGER NOT NULL, user_id INTEGER, recording_id INTEGER, completed BOOLEAN, completed_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id), FOREIGN KEY(recording_id) REFERENCES recording (id)
+);
+CREATE INDEX ix_student_progress_user_id ON student_progress (user_id);
+CREATE INDEX ix_student_progress_recording_id ON student_progress (recording_id);
+'''
+
+# Users 1-3, one trainer with a batch and a recording; user 99 and batch 99 were deleted without their rules applied
+BASELINE_ROWS = '''
+INSERT INTO user (id, name, email, password_hash, role) VALUES
+    (1, 'Admin', 'admin@lms.com', 'x', 'admin'),
+    (2, 'Trainer', 'trainer@lms.com', 'x', 'trainer'),
+    (3, 'Student', 'student@lms.com', 'x', 'student');
+INSERT INTO trainer (id, name, email) VALUES (1, 'Trainer', 'trainer@lms.com');
+INSERT INTO batch (id, name, trainer_id) VALUES (1, 'Batch', 1);
+INSERT INTO recording (id, filename, original_name, batch_id) VALUES (1, 'r.mp4', 'r.mp4', 1);
+INSERT INTO enrollment (id, user_id, batch_id) VALUES (1, 3, 1);
+INSERT INTO student_progress (id, user_id, recording_id, completed) VALUES (1, 3, 1, 1), (2, 99, 1, 1);
+INSERT INTO "query" (id, user_id, batch_id, message, status) VALUES (1, 3, 1, 'Hi', 'Open'), (2, 3, 99, 'Old batch', 'Open');
+INSERT INTO otp__token (id, user_id, token, expires_at) VALUES (1, 3, '123456', '2020-01-01 00:00:00');
+'''
+
+
+def start_app(db_path):
+    # lms.py migrates the database it is pointed at while being imported, so start it in a fresh interpreter
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+    result = subprocess.run([sys.executable, '-c', 'import lms'], env=env, cwd=os.path.dirname(lms.__file__),
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def row_counts(conn):
+    tables = ['user', 'trainer', 'batch', 'recording', 'enrollment', 'student_progress', 'query', 'otp__token']
+    return {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables}
+
+
+def test_baseline_database_gets_on_delete_rules(tmp_path):
+    db_path = tmp_path / 'baseline.db'
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(BASELINE_SCHEMA + BASELINE_ROWS)
+        before = row_counts(conn)
+    conn.close()
+
+    output = start_app(db_path)
+    assert 'Deleted 1 student_progress rows' in output
+    assert 'Cleared query.batch_id on 1 rows' in output
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA foreign_keys=ON')
+    assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
+    # Only the orphaned progress row is gone; the query that lost its batch is kept without one
+    assert row_counts(conn) == dict(before, student_progress=before['student_progress'] - 1)
+    assert conn.execute('SELECT batch_id FROM "query" WHERE id = 2').fetchone() == (None,)
+
+    # Deleting a user now removes their progress, queries and OTP tokens instead of failing on query.user_id
+    # (enrollments are still removed by the ORM cascade, as /delete_student does)
+    conn.execute('DELETE FROM enrollment WHERE user_id = 3')
+    conn.execute('DELETE FROM user WHERE id = 3')
+    after = row_counts(conn)
+    assert (after['query'], after['student_progress'], after['otp__token']) == (0, 0, 0)
+    conn.close()
+
+    backups = list(tmp_path.glob('baseline.db.*.bak'))
+    assert len(backups) == 1
+    with sqlite3.connect(backups[0]) as conn:
+        assert row_counts(conn) == before
+    conn.close()
+
+    # A second start finds nothing left to migrate and takes no further backup
+    assert 'Migrated foreign keys' not in start_app(db_path)
+    assert len(list(tmp_path.glob('baseline.db.*.bak'))) == 1
+
+
+def test_duplicate_rows_collapse_before_unique_indexes(tmp_path):
+    db_path = tmp_path / 'duplicates.db'
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(BASELINE_SCHEMA + BASELINE_ROWS + '''
+            INSERT INTO enrollment (id, user_id, batch_id) VALUES (5, 3, 1), (6, 3, 1);
+            INSERT INTO student_progress (id, user_id, recording_id, completed, completed_at) VALUES
+                (10, 2, 1, 0, NULL), (11, 2, 1, 1, '2024-05-01 10:00:00'), (12, 2, 1, 0, NULL);
+        ''')
+    conn.close()
+
+    output = start_app(db_path)
+    assert 'Removed duplicate enrollment rows [5, 6] before creating their unique index; kept rows [1].' in output
+    assert 'Removed duplicate student_progress rows [11, 12] before creating their unique index; kept rows [10].' in output
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT id FROM enrollment WHERE user_id = 3').fetchall() == [(1,)]
+    # The oldest row stays, and picks up the completion recorded on a dropped one
+    assert conn.execute('SELECT id, completed, completed_at FROM student_progress WHERE user_id = 2').fetchall() == [
+        (10, 1, '2024-05-01 10:00:00')]
+    indexes = {row[1] for row in conn.execute('PRAGMA index_list(student_progress)')}
+    assert 'ix_sp_user_rec' in indexes
+    conn.close()
+
+
+def test_delete_student_with_queries(app, admin_client, data):
+    with app.app_context():
+        student = lms.User(name='Leaving', email='leaving@lms.com', role='student')
+        student.set_password('student123')
+        lms.db.session.add(student)
+        lms.db.session.flush()
+        lms.db.session.add(lms.Query(user_id=student.id, batch_id=data['small_batch'], message='Bye'))
+        lms.db.session.add(lms.StudentProgress(user_id=student.id, recording_id=data['recording'], completed=True))
+        lms.db.session.commit()
+        student_id = student.id
+
+    response = admin_client.get(f'/delete_student/{student_id}')
+    assert response.status_code == 302
+    with app.app_context():
+        assert lms.db.session.get(lms.User, student_id) is None
+        assert lms.Query.query.filter_by(user_id=student_id).count() == 0
+        assert lms.StudentProgress.query.filter_by(user_id=student_id).count() == 0
@@ -0,0 +1,38 @@
+import io
+
+import lms
+
+
+def wait_for_profile_pics():
+    # PROFILE_PIC_EXECUTOR has a single worker, so this returns once earlier saves are done
+    lms.PROFILE_PIC_EXECUTOR.submit(lambda: None).result()
+
+
+def test_profile_pic_is_saved_in_background(app, data):
+    client = app.test_client()
+    client.post('/login', data={'email': 'student3@lms.com', 'password': 'student123'})
+    response = client.post('/student/profile', content_type='multipart/form-data',
+                           data={'name': 'Student 3', 'profile_pic': (io.BytesIO(b'png-bytes'), 'me.png')})
+    assert response.status_code == 200
+    wait_for_profile_pics()
+
+    with app.app_context():
+        user = lms.db.session.get(lms.User, data['students'][3])
+        assert user.profile_pic == f'student_{user.id}_me.png'
+    assert (lms.PROFILE_PICS_DIR / user.profile_pic).read_bytes() == b'png-bytes'
+    assert not list(lms.PROFILE_PICS_DIR.glob('.*.part'))
+
+
+def test_oversized_profile_pic_keeps_other_fields(app, data):
+    client = app.test_client()
+    client.post('/login', data={'email': 'student4@lms.com', 'password': 'student123'})
+    big = io.BytesIO(b'x' * (lms.MAX_PROFILE_PIC_SIZE + 1))
+    response = client.post('/student/profile', content_type='multipart/form-data',
+                           data={'name': 'Renamed', 'phone': '555', 'profile_pic': (big, 'big.png')})
+    assert response.status_code == 200
+    assert b'it was not changed' in response.data
+    wait_for_profile_pics()
+
+    with app.app_context():
+        user = lms.db.session.get(lms.User, data['students'][4])
+        assert (user.name, user.phone, user.profile_pic) == ('Renamed', '555', None)
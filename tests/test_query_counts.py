@@ -0,0 +1,121 @@
+import lms
+from conftest import login
+
+# Query budgets for the pages that used to issue one query per row (N+1).
+# Every budget includes the SELECT that loads the logged-in user.
+STUDENT_BATCHES_MAX = 3    # user, student, enrollments JOIN batch
+BATCH_ENROLLMENTS_MAX = 6  # user, batch + trainer, enrollments, their users, recording count, completed counts
+PROGRESS_UPDATE_MAX = 2    # user, INSERT ... ON CONFLICT
+STUDENT_DASHBOARD_MAX = 5  # user, enrollments, their batches + trainer, recordings, completed recording ids
+TRAINER_DASHBOARD_MAX = 5  # user, trainer, its batches, open queries, recording count
+BATCH_PAGE_MAX = 5         # batch + trainer, recordings, user, enrollment check, the student's progress
+ADMIN_METRICS_MAX = 7      # user, unassigned batches, five counts (cold cache)
+ADMIN_DASHBOARD_MAX = 4    # user, students, batches + trainer, trainers
+VIEW_ALL_MAX = {
+    '/view_all_batches': 3,   # user, page of batches + trainer, total count
+    '/view_all_students': 5,  # user, page of students, their enrollments, those batches + trainer, total count
+    '/view_all_trainers': 4,  # user, page of trainers, their batches, total count
+}
+
+
+def test_student_batches(admin_client, data, count_queries):
+    counts = []
+    # students[0] is in both batches, students[1] only in the large one
+    for student_id in data['students'][:2]:
+        with count_queries() as statements:
+            response = admin_client.get(f'/student/{student_id}/batches')
+        assert response.status_code == 200
+        assert len(statements) <= STUDENT_BATCHES_MAX, statements
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_search_student_batches(admin_client, data, count_queries):
+    with count_queries() as statements:
+        response = admin_client.get('/search_student_batches', query_string={'query': 'student0@lms.com'})
+    assert response.status_code == 200
+    assert len(statements) <= STUDENT_BATCHES_MAX, statements
+
+
+def test_batch_enrollments(admin_client, data, count_queries):
+    counts = []
+    for batch_id in (data['small_batch'], data['large_batch']):
+        with count_queries() as statements:
+            response = admin_client.get(f'/batch/{batch_id}/enrollments')
+        assert response.status_code == 200
+        assert len(statements) <= BATCH_ENROLLMENTS_MAX, statements
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_progress_update(student_client, data, count_queries):
+    # First call inserts the row, the second one hits the ON CONFLICT branch
+    for _ in range(2):
+        with count_queries() as statements:
+            response = student_client.post('/api/progress/update', json={'recording_id': data['recording']})
+        assert response.status_code == 200
+        assert len(statements) <= PROGRESS_UPDATE_MAX, statements
+
+
+def test_progress_update_rejects_bad_recording_id(student_client, count_queries):
+    for body in (None, [], {}, {'recording_id': '1'}, {'recording_id': True}, {'recording_id': 1.5}):
+        with count_queries() as statements:
+            response = student_client.post('/api/progress/update', json=body)
+        assert response.status_code == 400, body
+        assert response.get_json()['status'] == 'error'
+        assert not any(s.startswith('INSERT') for s in statements)
+
+
+def test_student_dashboard(app, data, count_queries):
+    counts = []
+    # student0 is enrolled in both batches, student1 only in the large one
+    for email in ('student0@lms.com', 'student1@lms.com'):
+        client = login(app, email, 'student123')
+        with count_queries() as statements:
+            response = client.get('/dashboard')
+        assert response.status_code == 200
+        assert len(statements) <= STUDENT_DASHBOARD_MAX, statements
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_trainer_dashboard(trainer_client, count_queries):
+    with count_queries() as statements:
+        response = trainer_client.get('/dashboard')
+    assert response.status_code == 200
+    assert len(statements) <= TRAINER_DASHBOARD_MAX, statements
+
+
+def test_batch_page(student_client, trainer_client, admin_client, data, count_queries):
+    for client in (student_client, trainer_client, admin_client):
+        counts = []
+        for batch_id in (data['small_batch'], data['large_batch']):
+            with count_queries() as statements:
+                response = client.get(f'/batch/{batch_id}')
+            assert response.status_code == 200
+            assert len(statements) <= BATCH_PAGE_MAX, statements
+            counts.append(len(statements))
+        assert counts[0] == counts[1]
+
+
+def test_admin_metrics(admin_client, count_queries):
+    lms._metrics_cache.clear()
+    with count_queries() as statements:
+        response = admin_client.get('/dashboard')
+    assert response.status_code == 200
+    assert len(statements) <= ADMIN_METRICS_MAX, statements
+
+
+def test_admin_dashboard(admin_client, count_queries):
+    with count_queries() as statements:
+        response = admin_client.get('/admin_dashboard')
+    assert response.status_code == 200
+    assert len(statements) <= ADMIN_DASHBOARD_MAX, statements
+
+
+def test_view_all_pages(admin_client, count_queries):
+    for url, budget in VIEW_ALL_MAX.items():
+        with count_queries() as statements:
+            response = admin_client.get(url)
+        assert response.status_code == 200, url
+        assert len(statements) <= budget, statements
@@ -0,0 +1,22 @@
+import lms
+
+
+def test_search_matches_any_stored_email(app, admin_client, data):
+    # register() accepts addresses such as user@localhost, so search must find them too
+    with app.app_context():
+        student = lms.User(name='Local', email='local@localhost', role='student')
+        student.set_password('student123')
+        lms.db.session.add(student)
+        lms.db.session.commit()
+        student_id = student.id
+
+    for query in ('local@localhost', str(student_id)):
+        response = admin_client.get('/search_student_batches', query_string={'query': query})
+        assert response.status_code == 200, query
+        assert b'local@localhost' in response.data
+
+    response = admin_client.get('/search_trainer', query_string={'query': 'trainer@lms.com'})
+    assert response.status_code == 200
+    # A trainer's email never finds them through the student search
+    response = admin_client.get('/search_student_batches', query_string={'query': 'trainer@lms.com'})
+    assert response.status_code == 302